@@ -1,6 +1,8 @@
 import os
 from datetime import datetime, timezone, timedelta
 
+from srs_reader import scan_counts
+
 try:
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 except:
@@ -29,12 +31,23 @@ def format_size(path):
     if size < 1024 * 1024: return f"{size/1024:.1f} KB"
     return f"{size/(1024*1024):.2f} MB"
 
-def get_type_badge(filename, folder=""):
+def format_count(counts):
+    if counts is None: return "⚠️ 损坏"
+    return f"{sum(counts.values()):,}"
+
+def get_type_badge(filename, folder="", counts=None):
     """
-    类型判定逻辑：包含了 folder 判断
+    类型判定逻辑：优先使用 .srs 中实际的规则类型, 否则按 folder / 文件名判断
     """
     fname = filename.lower()
     fpath = folder.lower()
+
+    if counts:
+        if all(k.endswith("ip_cidr") for k in counts):
+            return "![IP](https://img.shields.io/badge/IP-CIDR-3498db?style=flat-square)"
+        if all(k.startswith("domain") for k in counts):
+            return "![Domain](https://img.shields.io/badge/DOMAIN-List-9b59b6?style=flat-square)"
+        return "![Rule](https://img.shields.io/badge/RULE-Set-95a5a6?style=flat-square)"
     
     if ("ip" in fpath or "ip" in fname or "cidr" in fname) and "domain" not in fname:
         return "![IP](https://img.shields.io/badge/IP-CIDR-3498db?style=flat-square)"
@@ -136,6 +149,8 @@ def generate_markdown():
     lines.append(f"<br>")
 
     file_data = []
+    # 规则数来自构建时写入的 rules-srs/counts.json, 缺失或过期的文件才重新解码
+    srs_counts = scan_counts(DIR_SRS) if os.path.exists(DIR_SRS) else {}
     if os.path.exists(DIR_JSON):
         for root, dirs, files in os.walk(DIR_JSON):
             files.sort()
@@ -148,19 +163,24 @@ def generate_markdown():
                 p_srs = os.path.join(rel_dir, f"{name}.srs").replace("\\", "/")
                 abs_json = os.path.join(DIR_JSON, p_json)
                 abs_srs = os.path.join(DIR_SRS, p_srs)
+                has_srs = os.path.exists(abs_srs)
                 file_data.append({
                     "name": name, "folder": rel_dir,
                     "p_json": p_json, "p_srs": p_srs,
                     "size_json": format_size(abs_json), "size_srs": format_size(abs_srs),
-                    "has_srs": os.path.exists(abs_srs)
+                    "has_srs": has_srs,
+                    "counts": srs_counts.get(p_srs)
                 })
         file_data.sort(key=lambda x: (x["folder"], x["name"]))
 
     lines.append(f"## 🚀 SRS 二进制规则集 (推荐)")
     lines.append(f"")
+    lines.append(f"> 规则数统计自 .srs 文件, 其中 IP 规则为合并重叠 / 相邻网段后的 CIDR 数, 可能少于源文件条目数。")
+    lines.append(f"")
     columns = f"| 规则名称 | 类型 | 大小 | <div align='center'>GitHub 源文件</div> | <div align='center'>CDN 加速下载</div> |"
-    lines.append(columns)
-    lines.append(f"| :--- | :---: | :---: | :---: | :---: |")
+    srs_columns = f"| 规则名称 | 类型 | 规则数 | 大小 | <div align='center'>GitHub 源文件</div> | <div align='center'>CDN 加速下载</div> |"
+    lines.append(srs_columns)
+    lines.append(f"| :--- | :---: | :---: | :---: | :---: | :---: |")
 
     srs_count = 0
     for item in file_data:
@@ -170,11 +190,12 @@ def generate_markdown():
         else:
             display_name = f"<b>{item['name']}</b>"
         
-        badge_type = get_type_badge(item["name"], item["folder"])
+        badge_type = get_type_badge(item["name"], item["folder"], item["counts"])
+        count = f"`{format_count(item['counts'])}`"
         size = f"`{item['size_srs']}`"
         source_col = generate_source_badge(REPO, item["p_json"])
         cdn_col = generate_cdn_badges_vertical(REPO, item["p_srs"])
-        lines.append(f"| {display_name} | {badge_type} | {size} | {source_col} | {cdn_col} |")
+        lines.append(f"| {display_name} | {badge_type} | {count} | {size} | {source_col} | {cdn_col} |")
         srs_count += 1
     
     lines.append(f"")
@@ -190,7 +211,7 @@ def generate_markdown():
         else:
             display_name = f"<b>{item['name']}</b>"
         
-        badge_type = get_type_badge(item["name"], item["folder"])
+        badge_type = get_type_badge(item["name"], item["folder"], item["counts"])
         source_col = generate_source_badge(REPO, item["p_json"])
         cdn_col = generate_json_badges_vertical(REPO, item["p_json"])
         lines.append(f"| {display_name} | {badge_type} | `{item['size_json']}` | {source_col} | {cdn_col} |")
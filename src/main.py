@@ -5,11 +5,13 @@ import tempfile
 import re
 import sys
 import time
+import signal
+import threading
 import subprocess
 from datetime import timedelta
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Set, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, CancelledError, as_completed
+from typing import Dict, List, Set, Optional, Tuple
 
 try:
     from rich.console import Console
@@ -21,6 +23,9 @@ except ImportError:
     print("Error: Please install rich (pip install rich)")
     sys.exit(1)
 
+from srs_reader import diff_counts, parse_cidr, scan_counts, verify_against_json, write_counts
+import overlap
+
 console = Console(record=True)
 ROOT_DIR = Path.cwd()
 CONFIG_FILE = ROOT_DIR / "repos.json"
@@ -29,9 +34,73 @@ DIR_JSON = ROOT_DIR / "rules-json"
 DIR_SRS = ROOT_DIR / "rules-srs"
 MAX_WORKERS = 4
 
+def env_seconds(name: str, default: int) -> int:
+    """读取正整数秒数配置, 格式错误时回退到默认值而不是在导入时崩溃"""
+    try:
+        value = int(os.getenv(name, default))
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+# 单个文件 (解析 + sing-box 编译) 的最长耗时, 超时即终止子进程
+COMPILE_TIMEOUT = env_seconds("COMPILE_TIMEOUT", 60)
+# 开启后遇到失败不立即中止, 编译完其余文件再统一报告所有失败
+KEEP_GOING = os.getenv("KEEP_GOING", "").lower() in ("1", "true", "yes") or "--keep-going" in sys.argv
+
 FLATTEN_TARGETS = {"rulesets", "ruleset"}
 
-REGEX_IP = re.compile(r'^(?:(?:[0-9]{1,3}\.){3}[0-9]{1,3}(?:/\d+)?)|(?:.*:.*)$')
+# --- 规则分类 ---
+# 所有条目拼成一段文本, 由一个多行正则一次扫描完成分类, 每行恰好产生一个匹配,
+# 命中的命名分组即类型 ("类型__来源写法"), 兜底的 invalid 分组收集无法识别的条目
+RULE_TYPES = ("domain", "domain_suffix", "domain_keyword", "ip_cidr")
+
+_OCTET = r'(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)'
+_IPV4 = rf'{_OCTET}(?:\.{_OCTET}){{3}}(?:/(?:3[0-2]|[12]?\d))?'
+_IPV6 = r'[0-9a-f]*:[0-9a-f:.]*(?:/(?:12[0-8]|1[01]\d|[1-9]?\d))?'
+_LABEL = r'[a-z0-9_\u00a1-\uffff](?:[a-z0-9_\u00a1-\uffff-]*[a-z0-9_\u00a1-\uffff])?'
+_DOMAIN = rf'(?:{_LABEL}\.)*{_LABEL}'
+# 顶级标签全为数字的不是域名 (如 1.2.3.256 这类写错的 IP), 不能落入域名分支
+_NOT_NUMERIC = r'(?!(?:[^\s.]*\.)*\d+(?:/\d+)?$)'
+
+REGEX_RULE = re.compile(rf"""^(?:
+    (?:ip-cidr6?,)?(?P<ip_cidr__v4>{_IPV4})(?:,no-resolve)?
+  | (?:ip-cidr6?,)?(?P<ip_cidr__v6>{_IPV6})(?:,no-resolve)?
+  | (?:full:|domain,){_NOT_NUMERIC}(?P<domain__full>{_DOMAIN})
+  | (?:domain-suffix,|domain:|\+\.){_NOT_NUMERIC}(?P<domain_suffix__prefixed>{_DOMAIN})
+  | {_NOT_NUMERIC}(?P<domain_suffix__subdomain>\.{_DOMAIN})
+  | (?:domain-keyword,|keyword:)(?P<domain_keyword__keyword>[^,\s]+)
+  | {_NOT_NUMERIC}(?P<domain_suffix__bare>{_DOMAIN})
+  | (?P<invalid>.*)
+)$""", re.MULTILINE | re.VERBOSE)
+
+def classify_rules(entries: Set[str]) -> Tuple[Dict[str, List[str]], List[str]]:
+    """
+    给每个条目打上 domain / domain_suffix / domain_keyword / ip_cidr 标签, 无法识别的归入 rejected。
+    裸域名沿用原先的语义按 domain_suffix 处理; 返回的各类型列表已排序去重。
+    """
+    buckets: Dict[str, Set[str]] = {t: set() for t in RULE_TYPES}
+    rejected: List[str] = []
+    text = "\n".join(e.lower() for e in entries)
+    for m in REGEX_RULE.finditer(text):
+        group = m.lastgroup
+        value = m.group(group)
+        rtype = group.split("__")[0]
+        if rtype == "invalid":
+            rejected.append(value)
+            continue
+        if group == "ip_cidr__v6":
+            # IPv6 的正则较宽松, 交给 inet_pton 做最终判定
+            try:
+                parse_cidr(value)
+            except ValueError:
+                rejected.append(value)
+                continue
+        buckets[rtype].add(value)
+    return {t: sorted(v) for t, v in buckets.items() if v}, sorted(rejected)
+
+cancel_event = threading.Event()
+running_procs: Set[subprocess.Popen] = set()
+procs_lock = threading.Lock()
 
 class WorkflowStats:
     def __init__(self):
@@ -41,7 +110,14 @@ class WorkflowStats:
         self.compile_success = 0
         self.compile_fail = 0
         self.total_rules = 0
-        self.details: List[Tuple[str, str, int]] = [] 
+        self.details: List[Tuple[str, Dict[str, int], int]] = [] 
+        self.rejected = 0
+        self.verify_success = 0
+        self.type_counts: Dict[str, int] = {}
+        self.previous_counts: Dict[str, Optional[Dict[str, int]]] = {}
+        self.changes: List[Tuple[str, Dict[str, int]]] = []
+        self.failures: List[str] = []
+        self.overlap: Optional[dict] = None
         self.status = "✅ 成功"
 
     @property
@@ -52,12 +128,36 @@ stats = WorkflowStats()
 
 def write_github_summary():
     if "GITHUB_STEP_SUMMARY" not in os.environ: return
-    sorted_details = sorted(stats.details, key=lambda x: x[2], reverse=True)[:20]
+    sorted_details = sorted(stats.details, key=lambda x: sum(x[1].values()), reverse=True)[:20]
     rows = []
-    for name, rtype, count in sorted_details:
-        icon = "🌐" if rtype == "domain_suffix" else "📡"
-        rows.append(f"| {name} | {icon} `{rtype}` | {count:,} |")
+    for name, type_counts, rejected in sorted_details:
+        types = " ".join(f"{'📡' if rtype == 'ip_cidr' else '🌐'} `{rtype}`" for rtype in type_counts)
+        rows.append(f"| {name} | {types} | {sum(type_counts.values()):,} | {rejected:,} |")
     table_content = "\n".join(rows)
+    type_rows = "\n".join(f"| `{k}` | {v:,} |" for k, v in sorted(stats.type_counts.items()))
+    change_rows = []
+    for name, delta in sorted(stats.changes, key=lambda x: sum(abs(v) for v in x[1].values()), reverse=True)[:20]:
+        change_rows.append(f"| {name} | " + ", ".join(f"`{k}` {v:+,}" for k, v in delta.items()) + " |")
+    change_content = "\n".join(change_rows) or "| - | 无变化 |"
+    failure_content = ""
+    if stats.failures:
+        # sing-box 的 stderr 常跨多行, 放进代码块里才不会打断 markdown 列表
+        failure_content = "\n### ❌ 编译失败\n```text\n" + "\n\n".join(f.strip() for f in stats.failures) + "\n```\n"
+    overlap_content = ""
+    if stats.overlap:
+        report = stats.overlap
+        conflicts = [p for p in report["pairs"] if p["conflict"]]
+        overlap_rows = []
+        for p in conflicts[:15]:
+            example = f"`{p['examples'][0]}`" if p["examples"] else "-"
+            overlap_rows.append(f"| {p['a']} ↔ {p['b']} | {p['domain'][0]:,} / {p['domain'][1]:,} | {p['ip'][0]:,} / {p['ip'][1]:,} | {example} |")
+        overlap_content = f"""
+### ⚔️ 策略冲突分析
+> {report['files']} 个文件, {report['entries']:,} 条规则 (关键字 {report['keywords']:,}, 无法解析 {report['invalid']:,}), 耗时 {report['seconds']:.2f}s; 跨策略冲突 {len(conflicts)} 对, 同策略冗余 {len(report['pairs']) - len(conflicts)} 对
+
+| 文件对 (A ↔ B) | 域名重叠 (A 被 B 命中 / B 被 A 命中) | IP 重叠 | 示例 |
+| :--- | :---: | :---: | :--- |
+""" + ("\n".join(overlap_rows) or "| - | 0 | 0 | - |") + "\n"
     
     md_content = f"""
 # 🚀 构建报告: {stats.status}
@@ -67,11 +167,25 @@ def write_github_summary():
 | ⏱️ 耗时 | {stats.duration} |
 | 🔄 同步仓库 | {stats.sync_success} / {stats.sync_total} |
 | 🔨 编译文件 | {stats.compile_success} (失败: {stats.compile_fail}) |
+| 🔍 校验通过 | {stats.verify_success} / {stats.compile_success} |
 | 📊 规则总条数 | **{stats.total_rules:,}** |
+| 🚫 无效条目 | {stats.rejected:,} |
+{failure_content}
+### 🧮 .srs 规则类型统计
+> 统计自编译产物: `ip_cidr` 为 sing-box 合并重叠 / 相邻网段后的最少 CIDR 数, 可能少于上方按源条目计的规则总条数
 
+| 类型 | 规则数 |
+| :--- | :---: |
+{type_rows}
+
+### 🔀 与上次构建相比
+| 文件 | 变化 |
+| :--- | :--- |
+{change_content}
+{overlap_content}
 ### 📂 Top 20 文件
-| 文件名 | 类型 | 规则数 |
-| :--- | :--- | :---: |
+| 文件名 | 类型 | 规则数 | 无效条目 |
+| :--- | :--- | :---: | :---: |
 {table_content}
 """
     with open(os.environ["GITHUB_STEP_SUMMARY"], "a", encoding="utf-8") as f: f.write(md_content)
@@ -83,6 +197,45 @@ def handle_error(phase: str, error_msg: Exception | str):
     write_github_summary()
     sys.exit(1)
 
+def cancel_compile_jobs():
+    """通知排队中的任务放弃执行, 并终止仍在运行的 sing-box 子进程"""
+    cancel_event.set()
+    with procs_lock:
+        procs = list(running_procs)
+    for proc in procs:
+        kill_process_group(proc)
+
+def kill_process_group(proc: subprocess.Popen):
+    """子进程运行在独立会话中, 连同它派生的进程一起终止, 避免残留进程占住输出管道"""
+    if proc.poll() is not None: return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def run_compile(cmd: List[str], name: str, deadline: float):
+    if cancel_event.is_set(): raise CancelledError(name)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                            start_new_session=True)
+    with procs_lock:
+        running_procs.add(proc)
+    try:
+        # 注册前可能已经触发取消, 此时 cancel_compile_jobs 看不到这个进程
+        if cancel_event.is_set(): kill_process_group(proc)
+        try:
+            _, stderr = proc.communicate(timeout=max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            kill_process_group(proc)
+            proc.communicate()
+            raise RuntimeError(f"{name}: 编译超时 (超过 {COMPILE_TIMEOUT}s)")
+    finally:
+        with procs_lock:
+            running_procs.discard(proc)
+
+    if cancel_event.is_set(): raise CancelledError(name)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{name}: {stderr.strip()}")
+
 def flatten_directory(target_dir: Path):
     """暴力去除多余层级 (如 rulesets)"""
     for item in list(target_dir.iterdir()): 
@@ -107,6 +260,10 @@ def git_sparse_clone(url: str, remote_tgt: str, temp_dir: str):
 
 def init_workspace():
     console.rule("[bold blue]阶段 1: 暴力清理旧文件[/bold blue]")
+    if DIR_SRS.exists():
+        # 优先读取上次校验阶段写下的 counts.json, 不必重新解码整个目录
+        with console.status("[bold yellow]📸 正在记录上次构建的规则数...[/bold yellow]"):
+            stats.previous_counts = scan_counts(DIR_SRS)
     dirs = [DIR_TXT, DIR_JSON, DIR_SRS]
     for d in dirs:
         if d.exists():
@@ -167,8 +324,10 @@ def run_sync_phase():
                 handle_error(f"同步 [{name}]", e)
     console.print(sync_table)
 
-def compile_file_worker(args) -> Optional[Tuple[str, str, int]]:
+def compile_file_worker(args) -> Optional[Tuple[str, Dict[str, int], int]]:
     file_path, rel_path = args
+    deadline = time.monotonic() + COMPILE_TIMEOUT
+    if cancel_event.is_set(): raise CancelledError(file_path.name)
     if not file_path.name.lower().endswith(('.txt', '.list', '.yaml', '.conf', '.json', '')):
         return None
 
@@ -177,34 +336,16 @@ def compile_file_worker(args) -> Optional[Tuple[str, str, int]]:
         with open(file_path, 'r', encoding='utf-8') as f:
             for line in f:
                 c = line.split('#')[0].split('//')[0].strip()
-                if not c or c.startswith("payload:") or "repo" in c: continue
-                c = c.replace("'", "").replace('"', "").replace(",", "").lstrip("-").strip()
+                if not c or c.startswith("payload:"): continue
+                c = c.replace("'", "").replace('"', "").replace(", ", ",").lstrip("-").strip().rstrip(",")
                 if c: rules.add(c)
     except:
         return None
     
     if not rules: return None
-    rules_list = list(rules)
 
-    fname = file_path.name.lower()
-    if "ip" in fname and "domain" not in fname: rtype = "ip_cidr"
-    elif "domain" in fname or "site" in fname: rtype = "domain_suffix"
-    else:
-        sample = rules_list[:10]
-        ip_cnt = sum(1 for x in sample if re.match(r'^\d+\.|:', x))
-        rtype = "ip_cidr" if ip_cnt > len(sample)/2 else "domain_suffix"
-
-    final_rules = []
-    if rtype == "ip_cidr":
-        for r in rules_list:
-            if REGEX_IP.match(r) and "inverse" not in r and "arpa" not in r:
-                final_rules.append(r)
-    else:
-        final_rules = rules_list
-
-    final_rules.sort()
-
-    if not final_rules: return None
+    classified, rejected = classify_rules(rules)
+    if not classified: return None
 
     path_parts = rel_path.parts
     if path_parts[0] in FLATTEN_TARGETS:
@@ -220,20 +361,20 @@ def compile_file_worker(args) -> Optional[Tuple[str, str, int]]:
     json_path = out_dir_json / f"{file_path.stem}.json"
     srs_path = out_dir_srs / f"{file_path.stem}.srs"
     
-    data = {"version": 1, "rules": [{rtype: final_rules}]}
+    # 每种类型单独成一条规则, sing-box 为每种类型使用各自的专用匹配器
+    data = {"version": 1, "rules": [{rtype: values} for rtype, values in classified.items()]}
     with open(json_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
-    res = subprocess.run(["sing-box", "rule-set", "compile", str(json_path), "-o", str(srs_path)],
-                         capture_output=True, text=True)
-    
-    if res.returncode != 0:
-        raise RuntimeError(f"{file_path.name}: {res.stderr.strip()}")
+    if time.monotonic() > deadline:
+        raise RuntimeError(f"{file_path.name}: 解析超时 (超过 {COMPILE_TIMEOUT}s)")
+    run_compile(["sing-box", "rule-set", "compile", str(json_path), "-o", str(srs_path)],
+                file_path.name, deadline)
 
     json_path.touch()
     srs_path.touch()
 
-    return (file_path.name, rtype, len(final_rules))
+    return (file_path.name, {rtype: len(values) for rtype, values in classified.items()}, len(rejected))
 
 def run_build_phase():
     console.rule("[bold blue]阶段 3: 编译 (.srs)[/bold blue]")
@@ -247,30 +388,109 @@ def run_build_phase():
         BarColumn(), TaskProgressColumn(), TimeElapsedColumn(), console=console
     ) as progress:
         task = progress.add_task("[cyan]正在编译...", total=len(files))
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = {executor.submit(compile_file_worker, f): f for f in files}
+        executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        futures = {executor.submit(compile_file_worker, f): f for f in files}
+        try:
             for future in as_completed(futures):
+                progress.advance(task)
                 try:
                     res = future.result()
                     if res:
                         stats.compile_success += 1
-                        stats.total_rules += res[2]
+                        stats.total_rules += sum(res[1].values())
+                        stats.rejected += res[2]
                         stats.details.append(res)
                         progress.update(task, description=f"[cyan]编译: {res[0]}")
-                    progress.advance(task)
+                except CancelledError:
+                    pass
                 except Exception as e:
                     stats.compile_fail += 1
-                    progress.stop()
-                    handle_error("编译文件", e)
-
-    msg = f"[bold]编译成功[/bold]: [green]{stats.compile_success}[/green]\n[bold]规则总数[/bold]: [cyan]{stats.total_rules:,}[/cyan]"
+                    stats.failures.append(str(e))
+                    if not KEEP_GOING: break
+        finally:
+            # 快速失败或用户中断: 取消排队任务并终止仍在运行的子进程
+            if not all(f.done() for f in futures):
+                cancel_compile_jobs()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    if stats.failures:
+        handle_error("编译文件", f"{len(stats.failures)} 个文件编译失败:\n" + "\n".join(stats.failures))
+
+    msg = (f"[bold]编译成功[/bold]: [green]{stats.compile_success}[/green]\n"
+           f"[bold]规则总数[/bold]: [cyan]{stats.total_rules:,}[/cyan]\n"
+           f"[bold]无效条目[/bold]: [yellow]{stats.rejected:,}[/yellow]")
     console.print(Panel(msg, title="🔨 编译阶段总结", border_style="green", expand=False))
 
+def run_verify_phase():
+    """解码每个 .srs 并与其 JSON 源文件逐条比对, 捕获损坏或截断的编译产物"""
+    console.rule("[bold blue]阶段 4: 校验 (.srs)[/bold blue]")
+    srs_files = sorted(DIR_SRS.rglob("*.srs"))
+    json_files = {p.relative_to(DIR_JSON).with_suffix("") for p in DIR_JSON.rglob("*.json")}
+    failures = [f"{rel}.json: 缺少对应的 .srs" for rel in sorted(json_files - {p.relative_to(DIR_SRS).with_suffix("") for p in srs_files})]
+
+    with Progress(
+        SpinnerColumn(), TextColumn("[bold blue]{task.description}"),
+        BarColumn(), TaskProgressColumn(), TimeElapsedColumn(), console=console
+    ) as progress:
+        task = progress.add_task("[cyan]正在校验...", total=len(srs_files))
+        file_counts: Dict[str, Dict[str, int]] = {}
+        for srs_path in srs_files:
+            rel = srs_path.relative_to(DIR_SRS)
+            progress.update(task, description=f"[cyan]校验: {srs_path.name}")
+            counts, problems = verify_against_json(srs_path, DIR_JSON / rel.with_suffix(".json"))
+            key = rel.as_posix()
+            if problems:
+                failures.extend(f"{rel}: {p}" for p in problems[:5])
+            else:
+                stats.verify_success += 1
+                file_counts[key] = counts
+            for k, v in counts.items():
+                stats.type_counts[k] = stats.type_counts.get(k, 0) + v
+            delta = diff_counts(stats.previous_counts.get(key) or {}, counts)
+            if delta: stats.changes.append((key, delta))
+            progress.advance(task)
+
+    for key, old in stats.previous_counts.items():
+        if not (DIR_SRS / key).exists():
+            stats.changes.append((key, diff_counts(old or {}, {})))
+
+    if failures:
+        handle_error("校验产物", "\n".join(failures))
+    write_counts(DIR_SRS, file_counts)
+
+    type_table = Table(box=box.SIMPLE_HEAD, caption="ip_cidr 按合并网段后的 CIDR 计数")
+    type_table.add_column("类型", style="cyan")
+    type_table.add_column("规则数", justify="right")
+    for k, v in sorted(stats.type_counts.items()):
+        type_table.add_row(k, f"{v:,}")
+    console.print(type_table)
+    console.print(f"[green]  ✅ {stats.verify_success} 个 .srs 与源文件一致, {len(stats.changes)} 个文件相比上次构建有变化[/green]")
+
+def run_analysis_phase():
+    """索引全部输出, 统计不同策略之间的重叠 (仅报告, 不影响构建结果)"""
+    console.rule("[bold blue]阶段 5: 冲突分析[/bold blue]")
+    with console.status("[bold yellow]🔎 正在建立索引...[/bold yellow]"):
+        report = overlap.analyze(DIR_JSON)
+    stats.overlap = report
+
+    table = Table(box=box.SIMPLE_HEAD)
+    table.add_column("文件对", style="cyan")
+    table.add_column("性质")
+    table.add_column("域名", justify="right")
+    table.add_column("IP", justify="right")
+    for p in report["pairs"][:15]:
+        kind = "[red]冲突[/red]" if p["conflict"] else "[dim]冗余[/dim]"
+        table.add_row(f"{p['a']} ↔ {p['b']}", kind, f"{sum(p['domain']):,}", f"{sum(p['ip']):,}")
+    console.print(table)
+    console.print(f"[green]  ✅ 已分析 {report['entries']:,} 条规则 (关键字 {report['keywords']:,}, 无法解析 {report['invalid']:,}), 耗时 {report['seconds']:.2f}s[/green]")
+
 def main():
     try:
         init_workspace()
         run_sync_phase()
         run_build_phase()
+        run_verify_phase()
+        run_analysis_phase()
         console.rule("[bold green]✨ 全部完成 ✨[/bold green]")
         write_github_summary()
     except KeyboardInterrupt:
@@ -0,0 +1,254 @@
+"""
+规则集重叠 / 冲突分析
+
+一次读取 rules-json 下的全部输出, 建立两类紧凑索引:
+  - 域名: 哈希表 "名称 -> 文件位掩码", 分 domain (精确)、domain_suffix (含自身)、
+    ".xxx" 形式的后缀 (仅子域) 三张表, 查询时沿父域逐级查表即可完成后缀匹配;
+  - IP: 每个文件一组按起点排序、已合并的整数区间, 用二分查找判断相交;
+  - 关键字: 每个文件的关键字编译成一个正则, 对其他文件的全部域名 / 关键字做一次子串扫描。
+不同策略 (direct / block / policy) 之间的重叠视为冲突, 同一策略内的重叠视为冗余。
+"""
+import os
+import sys
+import re
+import json
+import time
+from bisect import bisect_right
+from itertools import chain
+from typing import Dict, List, Tuple
+
+from srs_reader import merge_ranges, parse_cidr
+
+MAX_EXAMPLES = 5
+
+
+def strategy_of(rel_path: str) -> str:
+    """rules-json 下的第一级目录即策略, 如 direct/domain/x.json -> direct"""
+    parts = rel_path.split("/")
+    return parts[0] if len(parts) > 1 else "-"
+
+
+def _parents(name: str, include_self: bool = True):
+    """依次产出 name (可选) 及其各级父域: a.b.com -> a.b.com, b.com, com"""
+    if include_self: yield name
+    i = name.find(".")
+    while i >= 0:
+        name = name[i + 1:]
+        yield name
+        i = name.find(".")
+
+
+def _iter_bits(mask: int):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class _FileEntries:
+    def __init__(self, rel: str):
+        self.rel = rel
+        self.strategy = strategy_of(rel)
+        self.domain = set()
+        self.suffix = set()
+        self.keyword = set()
+        self.ranges: List[Tuple[int, int, int, str]] = []
+        self.invalid = 0
+
+
+def _collect(rule: dict, entries: _FileEntries):
+    if rule.get("type") == "logical":
+        for sub in rule.get("rules", []): _collect(sub, entries)
+        return
+    entries.domain.update(d.lower() for d in rule.get("domain", []))
+    entries.suffix.update(d.lower() for d in rule.get("domain_suffix", []))
+    entries.keyword.update(k.lower() for k in rule.get("domain_keyword", []))
+    for cidr in rule.get("ip_cidr", []):
+        try:
+            entries.ranges.append(parse_cidr(cidr) + (cidr,))
+        except ValueError:
+            entries.invalid += 1
+
+
+def load_entries(root) -> List[_FileEntries]:
+    result = []
+    for dirpath, _, files in os.walk(root):
+        for name in sorted(files):
+            if not name.endswith(".json"): continue
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root).replace("\\", "/")
+            entries = _FileEntries(rel[:-len(".json")])
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    rules = json.load(f).get("rules", [])
+            except (OSError, ValueError):
+                continue
+            for rule in rules: _collect(rule, entries)
+            result.append(entries)
+    result.sort(key=lambda e: e.rel)
+    return result
+
+
+class _Pair:
+    def __init__(self, a: _FileEntries, b: _FileEntries):
+        self.a, self.b = a, b
+        self.domain_a_in_b = 0
+        self.domain_b_in_a = 0
+        self.ip_a_in_b = 0
+        self.ip_b_in_a = 0
+        self.examples: List[str] = []
+
+    def add(self, owner: int, kind: str, count_example):
+        # owner 为 0 表示 a 的条目被 b 命中, 为 1 表示反方向
+        attr = f"{kind}_{'a_in_b' if owner == 0 else 'b_in_a'}"
+        setattr(self, attr, getattr(self, attr) + 1)
+        if len(self.examples) < MAX_EXAMPLES:
+            self.examples.append(count_example())
+
+    def as_dict(self) -> dict:
+        return {
+            "a": self.a.rel, "b": self.b.rel,
+            "conflict": self.a.strategy != self.b.strategy,
+            "domain": (self.domain_a_in_b, self.domain_b_in_a),
+            "ip": (self.ip_a_in_b, self.ip_b_in_a),
+            "total": self.domain_a_in_b + self.domain_b_in_a + self.ip_a_in_b + self.ip_b_in_a,
+            "examples": self.examples,
+        }
+
+
+def _covering(name: str, exact: bool, sub_only_self: bool,
+              exact_idx: Dict[str, int], suffix_idx: Dict[str, int], sub_only_idx: Dict[str, int]) -> int:
+    """
+    返回能命中 name 的文件位掩码。
+    exact: 同时查精确域名表 (name 本身是 domain 条目时);
+    sub_only_self: ".name" 形式的后缀也算命中 (name 来自 ".xxx" 后缀条目时)。
+    """
+    mask = exact_idx.get(name, 0) if exact else 0
+    mask |= suffix_idx.get(name, 0)
+    if sub_only_self: mask |= sub_only_idx.get(name, 0)
+    for parent in _parents(name, include_self=False):
+        mask |= suffix_idx.get(parent, 0) | sub_only_idx.get(parent, 0)
+    return mask
+
+
+def _covering_rule(name: str, exact: bool, sub_only_self: bool, other: _FileEntries) -> str:
+    """找出 other 中命中 name 的那条规则, 仅用于生成示例"""
+    if exact and name in other.domain: return name
+    if name in other.suffix: return name
+    if sub_only_self and "." + name in other.suffix: return "." + name
+    for parent in _parents(name, include_self=False):
+        if parent in other.suffix: return parent
+        if "." + parent in other.suffix: return "." + parent
+    return "?"
+
+
+def analyze(root) -> dict:
+    """
+    分析 root (rules-json) 下所有规则集两两之间的重叠。
+    返回 {"files", "entries", "keywords", "invalid", "seconds", "pairs"}, pairs 只包含存在重叠的文件对,
+    按 (是否跨策略冲突, 重叠数) 降序排列。
+    """
+    start = time.perf_counter()
+    files = load_entries(root)
+
+    exact_idx: Dict[str, int] = {}
+    suffix_idx: Dict[str, int] = {}
+    sub_only_idx: Dict[str, int] = {}
+    for i, f in enumerate(files):
+        bit = 1 << i
+        for d in f.domain: exact_idx[d] = exact_idx.get(d, 0) | bit
+        for d in f.suffix:
+            if d.startswith("."):
+                sub_only_idx[d[1:]] = sub_only_idx.get(d[1:], 0) | bit
+            else:
+                suffix_idx[d] = suffix_idx.get(d, 0) | bit
+
+    pairs: Dict[Tuple[int, int], _Pair] = {}
+
+    def pair(i: int, j: int) -> Tuple[_Pair, int]:
+        key = (min(i, j), max(i, j))
+        if key not in pairs: pairs[key] = _Pair(files[key[0]], files[key[1]])
+        return pairs[key], 0 if i < j else 1
+
+    total = 0
+    for i, f in enumerate(files):
+        own = ~(1 << i)
+        for kind, names in (("domain", f.domain), ("suffix", f.suffix)):
+            total += len(names)
+            # 排序保证示例在多次构建之间稳定
+            for name in sorted(names):
+                exact = kind == "domain"
+                sub_only_self = name.startswith(".")
+                lookup = name[1:] if sub_only_self else name
+                mask = _covering(lookup, exact, sub_only_self, exact_idx, suffix_idx, sub_only_idx) & own
+                for j in _iter_bits(mask):
+                    p, owner = pair(i, j)
+                    p.add(owner, "domain", lambda: (
+                        f"{name} ({f.rel}) ⊂ {_covering_rule(lookup, exact, sub_only_self, files[j])} ({files[j].rel})"))
+
+    # 关键字: 文件 i 的关键字是文件 j 中某个域名 / 关键字的子串, 即 j 的该条目被 i 命中
+    texts = {}
+    for i, f in enumerate(files):
+        if not f.keyword: continue
+        total += len(f.keyword)
+        pattern = re.compile("|".join(map(re.escape, sorted(f.keyword, key=len, reverse=True))))
+        line_re = re.compile(rf"^[^\n]*?(?:{pattern.pattern})[^\n]*$", re.MULTILINE)
+        for j, other in enumerate(files):
+            if i == j: continue
+            if j not in texts:
+                names = sorted(set(chain(other.domain, (d.lstrip(".") for d in other.suffix), other.keyword)))
+                texts[j] = "\n".join(names)
+            for m in line_re.finditer(texts[j]):
+                name = m.group()
+                p, owner = pair(j, i)
+                p.add(owner, "domain", lambda: (
+                    f"{name} ({other.rel}) ⊂ keyword:{pattern.search(name).group()} ({f.rel})"))
+
+    # IP: 每个文件的合并区间按版本拆成起点 / 终点两个整数数组
+    intervals = []
+    for f in files:
+        merged = merge_ranges((v, lo, hi) for v, lo, hi, _ in f.ranges)
+        by_version = {4: ([], []), 6: ([], [])}
+        for v, lo, hi in merged:
+            by_version[v][0].append(lo)
+            by_version[v][1].append(hi)
+        intervals.append(by_version)
+
+    ip_files = [i for i, f in enumerate(files) if f.ranges]
+    for i in ip_files:
+        total += len(files[i].ranges)
+        for j in ip_files:
+            if i == j: continue
+            for v, lo, hi, text in files[i].ranges:
+                starts, ends = intervals[j][v]
+                k = bisect_right(starts, hi) - 1
+                if k >= 0 and ends[k] >= lo:
+                    p, owner = pair(i, j)
+                    p.add(owner, "ip", lambda: f"{text} ({files[i].rel}) ∩ {files[j].rel}")
+
+    result = sorted((p.as_dict() for p in pairs.values()),
+                    key=lambda d: (d["conflict"], d["total"]), reverse=True)
+    return {
+        "files": len(files),
+        "entries": total,
+        "keywords": sum(len(f.keyword) for f in files),
+        "invalid": sum(f.invalid for f in files),
+        "seconds": time.perf_counter() - start,
+        "pairs": result,
+    }
+
+
+def main(argv: List[str]) -> int:
+    root = argv[0] if argv else "rules-json"
+    report = analyze(root)
+    print(f"📊 {report['files']} 个文件, {report['entries']:,} 条规则 (关键字 {report['keywords']:,}, 无法解析 {report['invalid']:,}), 耗时 {report['seconds']:.2f}s")
+    for p in report["pairs"]:
+        tag = "⚠️ 冲突" if p["conflict"] else "♻️ 冗余"
+        d, ip = p["domain"], p["ip"]
+        print(f"{tag} {p['a']} ↔ {p['b']}: 域名 {d[0]:,}/{d[1]:,}  IP {ip[0]:,}/{ip[1]:,}")
+        for ex in p["examples"]: print(f"    {ex}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,571 @@
+"""
+sing-box 二进制规则集 (.srs) 流式解码器
+
+文件结构: 魔数 "SRS" + 版本号 (1 字节) + zlib 压缩的规则流。
+解压按块进行, 规则逐条产出, 不会一次性把整个解压结果读入内存。
+仅依赖标准库, docs_gen.py 在未安装 sing-box / rich 的环境中也能使用。
+"""
+import os
+import sys
+import json
+import zlib
+import struct
+import socket
+from itertools import chain, compress, repeat
+from operator import add
+from typing import Dict, Iterator, List, Optional, Tuple
+
+MAGIC = b"SRS"
+# 仅实现了 v1 的域名匹配器键布局 (后缀存为 reverse(d) + reverse("."+d)+"\r"),
+# 更高版本的后缀存储方式不同, 按 v1 解读会得出错误的计数, 直接拒绝
+MAX_VERSION = 1
+CHUNK_SIZE = 64 * 1024
+# 校验阶段写入 rules-srs 根目录的规则数缓存, 供下次构建与 docs_gen.py 直接读取
+COUNTS_FILE = "counts.json"
+
+# sing-box common/srs/binary.go 中的条目类型编号
+ITEM_QUERY_TYPE = 0
+ITEM_NETWORK = 1
+ITEM_DOMAIN = 2
+ITEM_DOMAIN_KEYWORD = 3
+ITEM_DOMAIN_REGEX = 4
+ITEM_SOURCE_IP_CIDR = 5
+ITEM_IP_CIDR = 6
+ITEM_SOURCE_PORT = 7
+ITEM_SOURCE_PORT_RANGE = 8
+ITEM_PORT = 9
+ITEM_PORT_RANGE = 10
+ITEM_PROCESS_NAME = 11
+ITEM_PROCESS_PATH = 12
+ITEM_PACKAGE_NAME = 13
+ITEM_WIFI_SSID = 14
+ITEM_WIFI_BSSID = 15
+ITEM_ADGUARD_DOMAIN = 16
+ITEM_PROCESS_PATH_REGEX = 17
+ITEM_NETWORK_TYPE = 18
+ITEM_NETWORK_IS_EXPENSIVE = 19
+ITEM_NETWORK_IS_CONSTRAINED = 20
+ITEM_FINAL = 0xFF
+
+STRING_ITEMS = {
+    ITEM_NETWORK: "network",
+    ITEM_DOMAIN_KEYWORD: "domain_keyword",
+    ITEM_DOMAIN_REGEX: "domain_regex",
+    ITEM_SOURCE_PORT_RANGE: "source_port_range",
+    ITEM_PORT_RANGE: "port_range",
+    ITEM_PROCESS_NAME: "process_name",
+    ITEM_PROCESS_PATH: "process_path",
+    ITEM_PACKAGE_NAME: "package_name",
+    ITEM_WIFI_SSID: "wifi_ssid",
+    ITEM_WIFI_BSSID: "wifi_bssid",
+    ITEM_PROCESS_PATH_REGEX: "process_path_regex",
+}
+UINT16_ITEMS = {
+    ITEM_QUERY_TYPE: "query_type",
+    ITEM_SOURCE_PORT: "source_port",
+    ITEM_PORT: "port",
+}
+IPSET_ITEMS = {
+    ITEM_SOURCE_IP_CIDR: "source_ip_cidr",
+    ITEM_IP_CIDR: "ip_cidr",
+}
+FLAG_ITEMS = {
+    ITEM_NETWORK_IS_EXPENSIVE: "network_is_expensive",
+    ITEM_NETWORK_IS_CONSTRAINED: "network_is_constrained",
+}
+
+# 域名匹配器 (succinct trie) 中的键是反转后的域名, 以 '\r' 结尾的键表示后缀匹配
+SUFFIX_LABEL = "\r"
+
+
+class SRSFormatError(RuntimeError):
+    """文件损坏、截断或包含无法识别的内容"""
+
+
+class _ZlibStream:
+    """按块解压的字节读取器"""
+
+    def __init__(self, fp):
+        self._fp = fp
+        self._z = zlib.decompressobj()
+        self._buf = b""
+        self._pos = 0
+
+    def _more(self) -> bytes:
+        try:
+            while True:
+                if self._z.unconsumed_tail:
+                    data = self._z.decompress(self._z.unconsumed_tail, CHUNK_SIZE)
+                elif self._z.eof:
+                    return b""
+                else:
+                    raw = self._fp.read(CHUNK_SIZE)
+                    if not raw:
+                        return self._z.flush()
+                    data = self._z.decompress(raw, CHUNK_SIZE)
+                if data: return data
+        except zlib.error as e:
+            raise SRSFormatError(f"解压失败: {e}")
+
+    def read(self, n: int) -> bytes:
+        end = self._pos + n
+        if end <= len(self._buf):
+            self._pos = end
+            return self._buf[end - n:end]
+        parts = [self._buf[self._pos:]]
+        have = len(parts[0])
+        while have < n:
+            data = self._more()
+            if not data:
+                raise SRSFormatError(f"数据意外结束 (需要 {n} 字节, 仅剩 {have} 字节), 文件可能被截断")
+            parts.append(data)
+            have += len(data)
+        self._buf = b"".join(parts)
+        self._pos = n
+        return self._buf[:n]
+
+    def byte(self) -> int:
+        if self._pos < len(self._buf):
+            self._pos += 1
+            return self._buf[self._pos - 1]
+        return self.read(1)[0]
+
+    def uvarint(self) -> int:
+        result = shift = 0
+        while True:
+            b = self.byte()
+            result |= (b & 0x7F) << shift
+            if b < 0x80: return result
+            shift += 7
+            if shift > 63: raise SRSFormatError("uvarint 溢出")
+
+    def finish(self):
+        """读到流末尾以触发 zlib 的 adler32 校验, 发现截断、规则之后的多余数据以及压缩流之后的尾部垃圾"""
+        trailing = len(self._buf) - self._pos
+        while True:
+            data = self._more()
+            if not data: break
+            trailing += len(data)
+        if not self._z.eof:
+            raise SRSFormatError("压缩流不完整, 文件可能被截断")
+        if trailing:
+            raise SRSFormatError(f"规则之后存在 {trailing} 字节多余数据")
+        # 压缩流结束后的原始字节 (拼接或被部分覆盖的文件) 同样视为损坏
+        extra = len(self._z.unused_data) + len(self._fp.read(1))
+        if extra:
+            raise SRSFormatError("压缩流之后存在多余数据")
+
+
+def _read_strings(r: _ZlibStream) -> List[str]:
+    items = []
+    for _ in range(r.uvarint()):
+        items.append(r.read(r.uvarint()).decode("utf-8"))
+    return items
+
+
+def _read_uint16s(r: _ZlibStream) -> List[int]:
+    n = r.uvarint()
+    return list(struct.unpack(f">{n}H", r.read(2 * n)))
+
+
+def _read_uint64s(r: _ZlibStream) -> Tuple[int, ...]:
+    n = r.uvarint()
+    return struct.unpack(f">{n}Q", r.read(8 * n))
+
+
+def _read_ipset(r: _ZlibStream, raw: bool) -> Tuple[List[str], List[Tuple[int, int, int]]]:
+    version = r.byte()
+    if version != 1: raise SRSFormatError(f"未知的 IP 集合版本: {version}")
+    (count,) = struct.unpack(">Q", r.read(8))
+    cidrs = []
+    ranges = []
+    for _ in range(count):
+        first = r.read(r.uvarint())
+        last = r.read(r.uvarint())
+        if len(first) != len(last) or len(first) not in (4, 16):
+            raise SRSFormatError("IP 段长度无效")
+        version = 4 if len(first) == 4 else 6
+        lo, hi = int.from_bytes(first, "big"), int.from_bytes(last, "big")
+        if lo > hi: raise SRSFormatError("IP 段起止顺序错误")
+        if raw: ranges.append((version, lo, hi))
+        cidrs.extend(_range_to_cidrs(version, lo, hi))
+    return cidrs, ranges
+
+
+def _range_to_cidrs(version: int, lo: int, hi: int) -> List[str]:
+    """把闭区间 [lo, hi] 拆成最少的 CIDR"""
+    width = 32 if version == 4 else 128
+    family = socket.AF_INET if version == 4 else socket.AF_INET6
+    result = []
+    while lo <= hi:
+        # 起点对齐决定的最大块, 再受剩余长度限制
+        size = (lo & -lo) if lo else 1 << width
+        while size > hi - lo + 1: size >>= 1
+        addr = socket.inet_ntop(family, lo.to_bytes(width // 8, "big"))
+        result.append(f"{addr}/{width - size.bit_length() + 1}")
+        lo += size
+    return result
+
+
+def parse_cidr(text: str) -> Tuple[int, int, int]:
+    """把 "1.2.3.0/24" / "::1" 解析为 (版本, 起始整数, 结束整数), 非法输入抛出 ValueError"""
+    addr, _, prefix = text.partition("/")
+    try:
+        if ":" in addr:
+            version, width, value = 6, 128, int.from_bytes(socket.inet_pton(socket.AF_INET6, addr), "big")
+        else:
+            version, width, value = 4, 32, int.from_bytes(socket.inet_pton(socket.AF_INET, addr), "big")
+    except OSError:
+        raise ValueError(f"无效的 IP 地址: {text}")
+    if prefix and not prefix.isdigit(): raise ValueError(f"无效的前缀长度: {text}")
+    length = int(prefix) if prefix else width
+    if not 0 <= length <= width: raise ValueError(f"无效的前缀长度: {text}")
+    host = (1 << (width - length)) - 1
+    return version, value & ~host, value | host
+
+
+def merge_ranges(ranges) -> List[Tuple[int, int, int]]:
+    """排序并合并重叠或相邻的 (版本, 起, 止) 区间"""
+    merged: List[Tuple[int, int, int]] = []
+    for version, lo, hi in sorted(ranges):
+        if merged and merged[-1][0] == version and lo <= merged[-1][2] + 1:
+            if hi > merged[-1][2]: merged[-1] = (version, merged[-1][1], hi)
+        else:
+            merged.append((version, lo, hi))
+    return merged
+
+
+def _bits(words) -> str:
+    """把 uint64 位图展开成 '0'/'1' 字符串 (低位在前)"""
+    return "".join(format(w, "064b")[::-1] for w in words)
+
+
+def _read_matcher_keys(r: _ZlibStream) -> List[str]:
+    """还原 succinct trie (LOUDS 编码) 中的全部键, 逐层展开, 内存中只保留当前一层"""
+    version = r.byte()
+    if version != 0: raise SRSFormatError(f"未知的域名匹配器版本: {version}")
+    leaves = _bits(_read_uint64s(r))
+    # 每个节点在位图中占 "子节点数个 0 + 一个 1", 最后一段是填充位
+    runs = list(map(len, _bits(_read_uint64s(r)).split("1")[:-1]))
+    labels = r.read(r.uvarint()).decode("latin-1")
+
+    keys: List[str] = []
+    level = [""]
+    node = pos = 0
+    while level:
+        n = len(level)
+        if node + n > len(runs): raise SRSFormatError("域名匹配器结构损坏")
+        keys.extend(compress(level, map("1".__eq__, leaves[node:node + n])))
+        counts = runs[node:node + n]
+        total = sum(counts)
+        parents = chain.from_iterable(map(repeat, level, counts))
+        level = list(map(add, parents, labels[pos:pos + total]))
+        if len(level) != total: raise SRSFormatError("域名匹配器标签数量与位图不符")
+        node += n
+        pos += total
+    if pos != len(labels) or node != len(runs):
+        raise SRSFormatError("域名匹配器标签数量与位图不符")
+    # 标签是逐字节存储的 UTF-8, 非 ASCII (IDN) 键需先还原成字符再按字符反转
+    try:
+        return [k if k.isascii() else k.encode("latin-1").decode("utf-8") for k in keys]
+    except UnicodeDecodeError:
+        raise SRSFormatError("域名匹配器中存在无效的 UTF-8 键")
+
+
+def _split_matcher_keys(keys: List[str]) -> Tuple[List[str], List[str]]:
+    """与 sing-box Matcher.Dump 一致: 把反转键还原为 domain / domain_suffix"""
+    domains = set()
+    suffixes = []
+    for key in keys:
+        if key.endswith(SUFFIX_LABEL):
+            suffixes.append(key[-2::-1])
+        else:
+            domains.add(key[::-1])
+    domain_suffix = []
+    for suffix in suffixes:
+        # ".example.com" + "example.com" 两个键合起来就是 domain_suffix: example.com
+        if suffix.startswith(".") and suffix[1:] in domains:
+            domains.discard(suffix[1:])
+            domain_suffix.append(suffix[1:])
+        else:
+            domain_suffix.append(suffix)
+    return sorted(domains), sorted(domain_suffix)
+
+
+def matcher_keys(domain: List[str], domain_suffix: List[str]) -> set:
+    """按 sing-box domain.NewMatcher 的规则生成键集合, 用于与 .srs 精确比对"""
+    keys = set()
+    for d in domain_suffix:
+        if d.startswith("."):
+            keys.add(d[::-1] + SUFFIX_LABEL)
+        else:
+            keys.add(d[::-1])
+            keys.add(("." + d)[::-1] + SUFFIX_LABEL)
+    for d in domain:
+        keys.add(d[::-1])
+    return keys
+
+
+def _read_default_rule(r: _ZlibStream, raw: bool) -> dict:
+    rule = {}
+    while True:
+        item = r.byte()
+        if item == ITEM_FINAL:
+            if r.byte(): rule["invert"] = True
+            return rule
+        if item in STRING_ITEMS:
+            rule[STRING_ITEMS[item]] = _read_strings(r)
+        elif item in UINT16_ITEMS:
+            rule[UINT16_ITEMS[item]] = _read_uint16s(r)
+        elif item in IPSET_ITEMS:
+            cidrs, ranges = _read_ipset(r, raw)
+            rule[IPSET_ITEMS[item]] = cidrs
+            if raw: rule[f"_{IPSET_ITEMS[item]}_ranges"] = ranges
+        elif item in FLAG_ITEMS:
+            rule[FLAG_ITEMS[item]] = True
+        elif item == ITEM_DOMAIN:
+            keys = _read_matcher_keys(r)
+            if raw:
+                rule["_matcher_keys"] = keys
+            domain, domain_suffix = _split_matcher_keys(keys)
+            if domain: rule["domain"] = domain
+            if domain_suffix: rule["domain_suffix"] = domain_suffix
+        elif item == ITEM_NETWORK_TYPE:
+            rule["network_type"] = list(r.read(r.uvarint()))
+        elif item == ITEM_ADGUARD_DOMAIN:
+            raise SRSFormatError("暂不支持解码 AdGuard 域名规则")
+        else:
+            raise SRSFormatError(f"未知的规则条目类型: {item}")
+
+
+def _read_rule(r: _ZlibStream, raw: bool) -> dict:
+    rule_type = r.byte()
+    if rule_type == 0:
+        return _read_default_rule(r, raw)
+    if rule_type == 1:
+        mode = r.byte()
+        if mode not in (0, 1): raise SRSFormatError(f"未知的逻辑规则模式: {mode}")
+        rule = {"type": "logical", "mode": "and" if mode == 0 else "or"}
+        rule["rules"] = [_read_rule(r, raw) for _ in range(r.uvarint())]
+        if r.byte(): rule["invert"] = True
+        return rule
+    raise SRSFormatError(f"未知的规则类型: {rule_type}")
+
+
+def read_version(path) -> int:
+    with open(path, "rb") as fp:
+        return _read_header(fp)
+
+
+def _read_header(fp) -> int:
+    head = fp.read(4)
+    if len(head) < 4 or head[:3] != MAGIC:
+        raise SRSFormatError("不是有效的 .srs 文件 (魔数不匹配)")
+    if head[3] > MAX_VERSION:
+        raise SRSFormatError(f"不支持的 .srs 版本: v{head[3]} (仅支持 v{MAX_VERSION} 及以下, 构建应输出 \"version\": {MAX_VERSION})")
+    return head[3]
+
+
+def iter_rules(path, raw: bool = False) -> Iterator[dict]:
+    """
+    逐条产出规则, 结构与 JSON 源文件中的 headless rule 相同。
+    IP 段还原为最小 CIDR 集合 (sing-box 编译时会合并重叠和相邻网段)。
+    raw=True 时额外附带 "_matcher_keys" (域名匹配器的原始键) 与 "_ip_cidr_ranges"
+    (整数区间), 供精确校验使用。
+    """
+    with open(path, "rb") as fp:
+        _read_header(fp)
+        r = _ZlibStream(fp)
+        for _ in range(r.uvarint()):
+            yield _read_rule(r, raw)
+        r.finish()
+
+
+def _count_into(counts: Dict[str, int], rule: dict):
+    for key, value in rule.items():
+        if key == "rules":
+            for sub in value: _count_into(counts, sub)
+        elif isinstance(value, list) and not key.startswith("_"):
+            counts[key] = counts.get(key, 0) + len(value)
+
+
+def count_rules(path) -> Dict[str, int]:
+    """按类型统计规则条数, 如 {"domain_suffix": 116921}"""
+    counts: Dict[str, int] = {}
+    for rule in iter_rules(path):
+        _count_into(counts, rule)
+    return counts
+
+
+def _compare_rule(expected: dict, actual: dict, where: str) -> List[str]:
+    problems = []
+    if expected.get("type") == "logical" or actual.get("type") == "logical":
+        if expected.get("mode", "and") != actual.get("mode", "and"):
+            problems.append(f"{where}: 逻辑模式不一致")
+        subs_e, subs_a = expected.get("rules", []), actual.get("rules", [])
+        if len(subs_e) != len(subs_a):
+            problems.append(f"{where}: 子规则数 {len(subs_a)}, 应为 {len(subs_e)}")
+        for i, (e, a) in enumerate(zip(subs_e, subs_a)):
+            problems.extend(_compare_rule(e, a, f"{where}.rules[{i}]"))
+        return problems
+
+    if expected.get("domain") or expected.get("domain_suffix") or "_matcher_keys" in actual:
+        want = matcher_keys(expected.get("domain", []), expected.get("domain_suffix", []))
+        got = set(actual.get("_matcher_keys", []))
+        if want != got:
+            problems.append(f"{where}: 域名不一致 (缺少 {len(want - got)}, 多出 {len(got - want)})")
+
+    for key in set(expected) | set(actual):
+        if key.startswith("_") or key in ("domain", "domain_suffix", "type", "mode", "rules"): continue
+        e, a = expected.get(key), actual.get(key)
+        if key in IPSET_ITEMS.values():
+            # sing-box 以合并后的区间存储 IP 集合, 比较合并后的整数区间
+            try:
+                e = merge_ranges(parse_cidr(x) for x in e or [])
+            except ValueError as err:
+                problems.append(f"{where}: JSON 中的 {key} 条目无法解析 ({err})")
+                continue
+            a = actual.get(f"_{key}_ranges", [])
+        elif isinstance(e, list) or isinstance(a, list):
+            # 未出现在 JSON 中的字段 sing-box 不会写入, 这里按集合比较
+            e, a = sorted(set(e or [])), sorted(set(a or []))
+        elif key == "invert":
+            e, a = bool(e), bool(a)
+        if e != a:
+            problems.append(f"{where}: 字段 {key} 不一致")
+    return problems
+
+
+def verify_against_json(srs_path, json_path) -> Tuple[Dict[str, int], List[str]]:
+    """
+    逐条比对 .srs 与其 JSON 源文件, 一次读取同时完成统计。
+    返回 (各类型规则数, 问题列表), 问题列表为空表示一致。
+    """
+    counts: Dict[str, int] = {}
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            expected = json.load(f).get("rules", [])
+    except (OSError, ValueError) as e:
+        return counts, [f"无法读取 JSON 源文件: {e}"]
+
+    problems = []
+    total = 0
+    try:
+        for i, rule in enumerate(iter_rules(srs_path, raw=True)):
+            total += 1
+            _count_into(counts, rule)
+            if i < len(expected):
+                problems.extend(_compare_rule(expected[i], rule, f"rules[{i}]"))
+    except (OSError, SRSFormatError) as e:
+        return counts, problems + [str(e)]
+    if total != len(expected):
+        problems.append(f"规则数 {total}, 应为 {len(expected)}")
+    return counts, problems
+
+
+def diff_counts(old: Dict[str, int], new: Dict[str, int]) -> Dict[str, int]:
+    """两次构建之间各类型规则数的变化量, 只保留有变化的类型"""
+    return {k: new.get(k, 0) - old.get(k, 0) for k in sorted(set(old) | set(new))
+            if new.get(k, 0) != old.get(k, 0)}
+
+
+def diff_rules(old_path, new_path) -> Dict[str, Tuple[List[str], List[str]]]:
+    """逐类型比较两个 .srs 的规则内容, 返回 {类型: (新增, 移除)}"""
+    def collect(path):
+        values: Dict[str, set] = {}
+        def walk(rule):
+            for key, value in rule.items():
+                if key == "rules":
+                    for sub in value: walk(sub)
+                elif isinstance(value, list):
+                    values.setdefault(key, set()).update(map(str, value))
+        for rule in iter_rules(path): walk(rule)
+        return values
+
+    old, new = collect(old_path), collect(new_path)
+    result = {}
+    for key in sorted(set(old) | set(new)):
+        added = sorted(new.get(key, set()) - old.get(key, set()))
+        removed = sorted(old.get(key, set()) - new.get(key, set()))
+        if added or removed: result[key] = (added, removed)
+    return result
+
+
+def _crc32(path) -> int:
+    crc = 0
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def write_counts(root, counts: Dict[str, Dict[str, int]]):
+    """把各 .srs 的规则数写入 root/counts.json, 附带 CRC32 以便读取时判断记录是否过期"""
+    files = {}
+    for rel, c in sorted(counts.items()):
+        files[rel] = {"crc32": _crc32(os.path.join(root, rel)), "counts": c}
+    with open(os.path.join(root, COUNTS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "files": files}, f, ensure_ascii=False, indent=2)
+
+
+def _read_counts_file(root) -> dict:
+    try:
+        with open(os.path.join(root, COUNTS_FILE), "r", encoding="utf-8") as f:
+            files = json.load(f).get("files", {})
+        return files if isinstance(files, dict) else {}
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def scan_counts(root) -> Dict[str, Optional[Dict[str, int]]]:
+    """
+    统计目录下所有 .srs 的规则数, 键为相对路径; 损坏的文件记为 None。
+    优先使用 counts.json 中 CRC32 一致的记录, 只有缺失或过期的文件才重新解码。
+    """
+    cached = _read_counts_file(root)
+    result: Dict[str, Optional[Dict[str, int]]] = {}
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if not name.endswith(".srs"): continue
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root).replace("\\", "/")
+            try:
+                entry = cached.get(rel)
+                if isinstance(entry, dict) and entry.get("crc32") == _crc32(path):
+                    result[rel] = entry.get("counts", {})
+                else:
+                    result[rel] = count_rules(path)
+            except (OSError, SRSFormatError):
+                result[rel] = None
+    return result
+
+
+def main(argv: List[str]) -> int:
+    try:
+        if len(argv) == 1:
+            counts = count_rules(argv[0])
+            print(f"{argv[0]} (v{read_version(argv[0])})")
+            for key, n in counts.items():
+                print(f"  {key:<20} {n:>10,}")
+            return 0
+        if len(argv) == 2 and argv[1].endswith(".json"):
+            _, problems = verify_against_json(argv[0], argv[1])
+            for p in problems: print(f"❌ {p}")
+            if not problems: print("✅ 校验通过")
+            return 1 if problems else 0
+        if len(argv) == 2:
+            for key, (added, removed) in diff_rules(argv[0], argv[1]).items():
+                print(f"{key}: +{len(added):,} / -{len(removed):,}")
+                for x in added[:20]: print(f"  + {x}")
+                for x in removed[:20]: print(f"  - {x}")
+            return 0
+    except (OSError, SRSFormatError) as e:
+        print(f"❌ {e}")
+        return 1
+    print("用法: srs_reader.py <file.srs>                 统计规则数")
+    print("      srs_reader.py <file.srs> <source.json>   与 JSON 源文件比对")
+    print("      srs_reader.py <old.srs> <new.srs>        比较两次构建")
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))